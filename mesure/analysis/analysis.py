@@ -1,4 +1,3 @@
-from cProfile import label
 import qcodes as qc
 from qcodes.dataset import (
     Measurement,
@@ -8,8 +7,6 @@ from qcodes.dataset import (
     load_or_create_experiment,
 )
 import numpy as np
-import matplotlib.pyplot as plt
-from qcodes.dataset.plotting import plot_dataset
 
 
 class Analyser:
@@ -78,32 +75,49 @@ class Analyser:
         """
         
         assert  (len(channels) == 2) or (len(channels) == 1), "Make sure you're only trying to plot for two or one gate."
+
+        # Only import matplotlib when plotting, so importing the package does not load it.
+        import matplotlib.pyplot as plt
+
         dataset = load_by_run_spec(experiment_name=experiment_name, captured_run_id=run_id)
         df = dataset.to_pandas_dataframe()
-        x = df.index.get_level_values("qdac_chan{:02d}_v".format(channels[0])).values
-        z = df["DMM_volt"]    
+        idx = df.index
+        x_name = "qdac_chan{:02d}_v".format(channels[0])
 
         fig1, ax1 = plt.subplots(constrained_layout=True)
         gain = 10**7
-        z = z.to_numpy() / gain
+
+        # Scale a single float32 copy of the data in place, multiplying by the reciprocal of the gain rather than dividing.
+        # float32 is plenty of precision for plotting and halves the memory the plot has to go through.
+        z = df["DMM_volt"].to_numpy(dtype=np.float32, copy=True)
+        np.multiply(z, np.float32(1.0 / gain), out=z)
 
         if len(channels) == 2:
 
             # pre-processing of data for plotting
-            y = df.index.get_level_values("qdac_chan{:02d}_v".format(channels[1])).values
-            x_unique = np.unique(x, return_counts=True)
-            x_unique_values = x_unique[0]
-            x_unique_n = len(x_unique[1])
-
-            y_unique = np.unique(y, return_counts=True)
-            y_unique_values = y_unique[0]
-            y_unique_n = len(y_unique[1])
-
-            z = z.to_numpy() / gain
-            z= np.abs(z.reshape((x_unique_n, y_unique_n)))
+            y_name = "qdac_chan{:02d}_v".format(channels[1])
+            x_level = idx.names.index(x_name)
+            y_level = idx.names.index(y_name)
+
+            # The sweep is a regular grid with channel 1 as the outer loop, so the number of steps
+            # of each channel is already known from the index levels and no np.unique pass is needed.
+            # Only the axis values are looked up from the levels and codes, without materialising the full index columns.
+            x_unique_n = idx.levshape[x_level]
+            y_unique_n = idx.levshape[y_level]
+            x_unique_values = idx.levels[x_level].to_numpy()[idx.codes[x_level][::y_unique_n]]
+            y_unique_values = idx.levels[y_level].to_numpy()[idx.codes[y_level][:y_unique_n]]
+
+            z = z.reshape((x_unique_n, y_unique_n))
+            np.abs(z, out=z)
+
+            # A snake scan sweeps channel 2 backwards on every odd row, so those rows are flipped to line up with the first one.
+            y_codes = idx.codes[y_level]
+            if x_unique_n > 1 and y_unique_n > 1 and y_codes[y_unique_n] != y_codes[0]:
+                z[1::2] = z[1::2, ::-1]
 
             # plot data and set labels
-            CS = ax1.contourf(x_unique_values,y_unique_values,z, levels=1000)
+            # pcolormesh expects the data with the y axis first, hence the transpose.
+            mesh = ax1.pcolormesh(x_unique_values, y_unique_values, z.T, shading='auto', rasterized=True)
             # ax1.set_title(f'2D Sweep of Channels {channels[0]} and {channels[1]}')
             ax1.set_xlabel(f'Channel {channels[0]} (V)')
             ax1.set_ylabel(f'Channel {channels[1]} (V)')
@@ -111,7 +125,7 @@ class Analyser:
 
             # labels = [-1.50,-0.75,0.00,0.75,1.50]
             # ax1.set_yticklabels(labels)
-            cbar = fig1.colorbar(CS)
+            cbar = fig1.colorbar(mesh)
             cbar.set_label("I (A)")
 
 
@@ -119,6 +133,7 @@ class Analyser:
             # ax1.set_title(f'1D Sweep of Channel {channels[0]}')
             ax1.set_xlabel(f'Channel {channels[0]} (V)')
             ax1.set_ylabel('I (A)')
+            x = np.asarray(idx.get_level_values(x_name))
             ax1.plot(x,z)
         
         
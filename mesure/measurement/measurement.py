@@ -1,52 +1,55 @@
-from logging import exception
-import pyvisa as visa
 import numpy as np
-import matplotlib.pyplot as plt
 import qcodes as qc
 from qcodes.dataset import (
     Measurement,
-    experiments,
     initialise_or_create_database_at,
-    load_by_run_spec,
     load_or_create_experiment,
 )
 from tqdm.notebook import tqdm
 
-from qcodes.instrument_drivers.QDevil.QDevil_QDAC import *
-from qcodes.instrument_drivers.Keysight.Keysight_34410A_submodules import *
+from qcodes.instrument_drivers.QDevil.QDevil_QDAC import QDac, Mode
+from qcodes.instrument_drivers.Keysight.Keysight_34410A_submodules import Keysight_34410A
 
 import time
+import math
+import logging
+import functools
+import contextlib
+
+logger = logging.getLogger(__name__)
 
 
 def exception_handler_general(func):
     
     """Decorator function to handle general case exceptions, so that
        no instrument remains open in the case of an error, KeyboardInterrupt or SystemExit.
+       The exception is re-raised once the connections are closed, so the caller knows the call failed.
 
     Args:
         func: A callable function.
 
    Returns:
-        bool: The return of func if successful. False if unsuccessful.
+        The return of func if successful.
     """
+    @functools.wraps(func)
     def inner_function(*args, **kwargs):
         self_arg = args[0] # First argument is the self
         try:
             return func(*args, **kwargs)
         except Exception as e:
-            print(f"Error! What went wrong is {e}.")
+            logger.exception(f"Error! What went wrong is {e}.")
             self_arg.close_connections()
-
+            raise
 
         except KeyboardInterrupt:
             print("KeyboardInterrupt")
             self_arg.close_connections()
+            raise
 
         except SystemExit:
             print("SystemExit")
-
-
             self_arg.close_connections()
+            raise
 
     return inner_function
 
@@ -60,6 +63,7 @@ def exception_handler_on_close(func):
     Returns:
         bool: The return of func if successful. False if unsuccessful.
     """
+    @functools.wraps(func)
     def inner_function(*args, **kwargs):
         try:
 
@@ -68,19 +72,51 @@ def exception_handler_on_close(func):
             print(f"Error! What went wrong is {e}.")
     return inner_function
 
+
+def _sleep_until(deadline):
+    """Sleep until time.monotonic() reaches deadline. Returns straight away if it already has.
+
+    Args:
+        deadline: The time.monotonic() value to wait for.
+    """
+    remaining = deadline - time.monotonic()
+    if remaining > 0:
+        time.sleep(remaining)
+
 class Device:
     """Class to create multichannel device object for measurement sweeps.
 
     Args:
             qdac_visa (string): the visa address of the QDAC.
             dmm_visa (string): the visa a
-            print_dac_overview (bool): Whether to print an overview of the DAC channels. Defaults to True.
+            print_dac_overview (bool): Whether to print an overview of the DAC channels. Defaults to False.
+            connected_channels (list): The channels connected to the device. Defaults to [].
+            investigation_channels (list): The investigation gates (typically plunger gates). Defaults to [].
+            update_currents_on_init (bool): Whether the overview should also read the current of every channel. This is
+                a separate query per channel and takes seconds, so by default the overview only shows the voltages and
+                settings, which need a single query. Only used when print_dac_overview is True. Defaults to False.
+
+    The device can be used as a context manager, so the instruments are closed when the with block exits.
     """
 
+    # A fixed set of attributes, so instances do not carry a __dict__.
+    __slots__ = (
+        'qdac', 'dmm', 'dac_open', 'dmm_open', 'connected_channels', 'investigation_channels',
+        'station', '_experiments', '_measurements', '_linspace_cache', '_ch_v', '_dmm_volt', '_dmm_volt_get',
+    )
+
+    # The QDAC only has 8 function generators to ramp with, so at most 8 channels can be ramped in one call.
+    _MAX_RAMP_CHANNELS = 8
+
     @exception_handler_general
-    def __init__(self, qdac_visa, dmm_visa, print_dac_overview=True, connected_channels=[], investigation_channels=[]):
+    def __init__(self, qdac_visa, dmm_visa, print_dac_overview=False, connected_channels=[], investigation_channels=[],
+                 update_currents_on_init=False):
         """Function to initialise instance of class. """
 
+        # Nothing is open yet, so close_connections can be called safely if opening an instrument fails.
+        self.dac_open = False
+        self.dmm_open = False
+
         t = time.localtime()
         current_time = time.strftime("%H:%M:%S", t)
         self.connected_channels=connected_channels
@@ -93,81 +129,427 @@ class Device:
         self.dmm = Keysight_34410A('DMM', address=dmm_visa)
         self.dmm_open = True
 
+        # The DMM voltage parameter and its get method, looked up once rather than on every reading.
+        self._dmm_volt = self.dmm.volt
+        self._dmm_volt_get = self._dmm_volt.get
+
+        # produce a station object to store the instruments, it is reused by every measurement made with this device.
+        self.station = qc.Station()
+        self.station.add_component(self.qdac)
+        self.station.add_component(self.dmm)
+
+        # experiments already loaded, keyed by (database_file, experiment_name, device_name).
+        self._experiments = {}
+
+        # measurements already registered, keyed by (database_file, experiment_name, device_name, name, connected channels).
+        self._measurements = {}
+
+        # sweep voltages and step ramp times already computed, keyed by (min_voltage, max_voltage, number_of_steps).
+        self._linspace_cache = {}
+
         self.qdac.reset()
 
-        for i in range(1,25):
+        # The .v parameter of each channel, keyed by channel number, so they are looked up once rather than on every call.
+        self._ch_v = {}
+
+        for channel_number, channel in enumerate(self.qdac.channels, start=1):
             # Set mode of the channels
-            eval("self.qdac.ch{:02d}.mode".format(i))(Mode.vhigh_ilow)
+            channel.mode(Mode.vhigh_ilow)
+
+            # Set slope of channels to 1 V/s (this is only stored by the driver, it is not sent to the QDAC).
+            channel.slope(1)
 
-            # Set slope of channels to 1 V/s
-            eval("self.qdac.ch{:02d}.slope".format(i))(1)
+            self._ch_v[channel_number] = channel.v
 
         if print_dac_overview:
             print("\nOverview of QDAC channels:\n")
-            print(self.qdac.print_overview(update_currents=True))
+            print(self.qdac.print_overview(update_currents=update_currents_on_init))
+
+    def __enter__(self):
+        """Allow the device to be used as a context manager, e.g. `with Device(...) as device:`."""
+        return self
 
-    def waiting_time(self, difference, slope=1):   
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the connections to the instruments when leaving the with block."""
+        self.close_connections()
+
+    @staticmethod
+    def waiting_time(difference, slope=1):   
         """The ramptime to use betweem the ramping between two voltages.
 
         Args:
-            current (float): the current voltage that you want to update to.
-            prev (float):the previous voltage that you want to update from
+            difference (float): the difference between the voltage that you want to update to and the previous voltage.
             slope (float): the rate of voltage change in V/s. Defaults to 1.
 
         Returns:
             float: the ramptime to use for ramping the voltage on a channel.
         """
 
-        time = np.abs(difference)/slope
+        time = abs(difference)/slope
         if time < 0.002:
             return 0.002
         else:
             return time
 
+    def _sweep_voltages(self, min_voltage, max_voltage, number_of_steps):
+        """The voltages of a linear sweep, reused when the same sweep is run again.
+
+        The voltages are returned as a tuple of python floats: it cannot be modified by the sweep that uses it,
+        and iterating over python floats is faster than over numpy scalars.
+
+        Args:
+            min_voltage (float): The voltage to sweep from.
+            max_voltage (float): The voltage to sweep to.
+            number_of_steps (int): The number of voltages in the sweep.
+
+        Returns:
+            tuple: The voltages of the sweep.
+        """
+        return self._sweep_steps(min_voltage, max_voltage, number_of_steps)[0]
+
+    def _sweep_steps(self, min_voltage, max_voltage, number_of_steps):
+        """The voltages of a linear sweep together with the ramp time of a single step, reused when the same sweep is run again.
+
+        The voltages are a linspace, so every step after the first one has the same ramp time
+        and it only has to be worked out once per sweep.
+
+        Args:
+            min_voltage (float): The voltage to sweep from.
+            max_voltage (float): The voltage to sweep to.
+            number_of_steps (int): The number of voltages in the sweep.
+
+        Returns:
+            tuple: The voltages of the sweep (a tuple of floats, see _sweep_voltages) and the ramp time of one step in seconds.
+        """
+        key = (min_voltage, max_voltage, number_of_steps)
+        steps = self._linspace_cache.get(key)
+        if steps is None:
+            voltages = tuple(np.linspace(min_voltage, max_voltage, number_of_steps).tolist())
+            step_wait = self.waiting_time((max_voltage - min_voltage) / max(number_of_steps - 1, 1))
+            steps = self._linspace_cache[key] = (voltages, step_wait)
+        return steps
+
+    def _load_experiment(self, database_file, experiment_name, device_name):
+        """Load or create the experiment to save a measurement to, reusing it across sweeps.
+
+        The database is only initialised when it is not the one currently in use.
+
+        Args:
+            database_file (str): The name of the database file to which you want to save your results.
+            experiment_name (str): The name of the experiment which to associate the measurement with.
+            device_name (str): The name of your device.
+
+        Returns:
+            Experiment: The QCoDeS experiment to pass to the Measurement object.
+        """
+        database_path = f"./measurement_results/{database_file}"
+        if qc.config.core.db_location != database_path:
+            # You can only have 1 db at a time
+            initialise_or_create_database_at(database_path)
+
+        key = (database_file, experiment_name, device_name)
+        if key not in self._experiments:
+            self._experiments[key] = load_or_create_experiment(
+            experiment_name=experiment_name,
+            sample_name=device_name)
+        return self._experiments[key]
+
+    def _setup_measurement(self, database_file, experiment_name, device_name, name, swept_channels, row_length, write_period):
+        """Set up the Measurement object for a sweep and the results to pass to its datasaver.
+
+        The Measurement object only depends on the experiment, its name and the connected channels, so it is
+        registered once and reused by later sweeps with the same settings.
+
+        Args:
+            database_file (str): The name of the database file to which you want to save your results.
+            experiment_name (str): The name of the experiment which to associate the measurement with.
+            device_name (str): The name of your device.
+            name (str): The name of the measurement.
+            swept_channels (list): The channels that are swept. The other connected channels are recorded at their current voltage.
+            row_length (int): The number of points saved in each call to add_result.
+            write_period (float): The time between periodic background database writes in seconds.
+
+        Returns:
+            tuple: The Measurement object, and one [parameter, value] pair per result to pass to add_result,
+                with the values of the fixed channels already filled in.
+        """
+        test_exp = self._load_experiment(database_file, experiment_name, device_name)
+
+        key = (database_file, experiment_name, device_name, name, tuple(self.connected_channels))
+        context_meas = self._measurements.get(key)
+        if context_meas is None:
+            # The Measurement object is used to obtain data from instruments in QCoDeS, 
+            # It is instantiated with both an experiment (to handle data) and station to control the instruments.
+            context_meas = Measurement(exp=test_exp, station=self.station, name=name)
+
+            # Register the independent parameters...
+            channel_set_points = [self._ch_v[channel] for channel in self.connected_channels]
+            for channel_number_v_function in channel_set_points:
+                context_meas.register_parameter(channel_number_v_function, paramtype='array')
+
+            # ...then register the dependent parameters. Results are added as whole arrays, so they are stored as array blobs.
+            context_meas.register_parameter(self._dmm_volt, setpoints=channel_set_points, paramtype='array')
+            self._measurements[key] = context_meas
+
+        # Time for periodic background database writes
+        context_meas.write_period = write_period
+
+        # One [parameter, value] pair per result, built once. Only the values are swapped in when results are saved.
+        results = [[self._ch_v[channel], None] for channel in self.connected_channels] + [[self._dmm_volt, None]]
+
+        fixed_channels = [(i, channel) for i, channel in enumerate(self.connected_channels) if channel not in swept_channels]
+        if fixed_channels:
+            # The voltages of the fixed channels are read in one query, and stored as arrays of the length of a saved row.
+            all_voltages = self._get_all_voltages_raw()
+            for i, channel in fixed_channels:
+                results[i][1] = np.full(row_length, all_voltages[channel])
+
+        return context_meas, results
+
+    def _set_channel_voltage_fast(self, channels, prev_voltages, voltages, ramptime):
+        """Start a ramp from known voltages with a precomputed ramp time, for use inside the sweep loops.
+
+        Unlike set_channel_voltage, this does not work out the ramp time or wait for the ramp to finish,
+        the caller already knows both from the sweep voltages.
+
+        Args:
+            channels (list): The channel numbers to ramp.
+            prev_voltages (list): The voltages the channels are currently at.
+            voltages (list): The voltages to ramp the channels to.
+            ramptime (float): The time the ramp should take, in seconds.
+
+        Returns:
+            float: The duration of the ramp in seconds.
+        """
+        return self.qdac.ramp_voltages(channels, prev_voltages, voltages, ramptime)
+
+    @contextlib.contextmanager
+    def _dmm_bus_triggered(self, samples=1, interval=None, delay=None):
+        """Switch the DMM to readings triggered over the bus for the duration of a with block.
+
+        With bus triggering a reading is armed with INIT before a ramp and only taken once *TRG is sent after
+        the ramp, so FETCH? returns as soon as the integration is done and no fixed sleep is needed before a read.
+        When more than one sample is requested, a single trigger starts a burst of readings paced by the DMM's
+        own sample timer, which are all stored in its memory and returned by one FETCH?.
+
+        The DMM is always switched back to immediate triggering when the block exits, even if the sweep fails,
+        since READ? (used by dmm.volt.get) would otherwise wait forever for a bus trigger.
+
+        Args:
+            samples (int): The number of readings to take per trigger. Defaults to 1.
+            interval (float): The time between readings in seconds, only used when samples > 1. Defaults to None.
+            delay (float): The time between the trigger and the first reading in seconds. Defaults to None, which leaves
+                the DMM's automatic delay in place.
+        """
+        dmm = self.dmm
+        try:
+            dmm.sense_function("DC Voltage")
+            dmm.sample.count(samples)
+            if samples > 1:
+                dmm.sample.source("TIM")
+                dmm.sample.timer(interval)
+            if delay is not None:
+                dmm.trigger.delay(delay)
+            dmm.trigger.count(1)
+            dmm.trigger.source("BUS")
+            yield
+        finally:
+            # The DMM may still be armed or in the middle of a burst of readings if the sweep was interrupted,
+            # so the measurement is aborted before its settings are changed.
+            dmm.abort_measurement()
+            dmm.sample.source("IMM")
+            dmm.sample.count(1)
+            dmm.trigger.auto_delay_enabled(True)
+            dmm.trigger.source("IMM")
+
+    def _read_after_ramp(self, ramp, *args, timed=False, **kwargs):
+        """Ramp the channels and read the DMM once the ramp has finished. Must be called inside _dmm_bus_triggered.
+
+        The DMM is armed with INIT before the ramp, so it is waiting for a trigger while the channels slew, and the
+        reading is started with *TRG once the ramp is done. FETCH? then blocks until the DMM has finished integrating,
+        so the channels cannot move again while it integrates.
+
+        Args:
+            ramp: The method that starts the ramp and returns its duration in seconds, e.g. _set_channel_voltage_fast.
+                None when the channels are already at their voltages and only a reading is needed.
+            *args: The positional arguments to pass to ramp.
+            timed (bool): Trigger the DMM as soon as the ramp has started instead of once it has finished, for a staircase
+                ramp during which the DMM takes its readings on its own sample timer. Defaults to False.
+            **kwargs: The keyword arguments to pass to ramp.
+
+        Returns:
+            list: The readings returned by FETCH?, one per sample set up in _dmm_bus_triggered.
+        """
+        dmm = self.dmm
+        dmm.init_measurement()
+        duration = ramp(*args, **kwargs) if ramp is not None else 0.0
+        if timed:
+            dmm.trigger.force()
+            time.sleep(duration)
+        else:
+            time.sleep(duration)
+            dmm.trigger.force()
+        return dmm.fetch()
+
+    @staticmethod
+    def _save_results(datasaver, results, values, points=None):
+        """Save measurement results into the db with one call to add_result, and write them to the db in one transaction.
+
+        Args:
+            datasaver: The DataSaver of the running measurement.
+            results (list): The [parameter, value] pairs set up by _setup_measurement.
+            values (dict): The values of the swept channels and of the readings, keyed by their position in results.
+                The fixed channels keep the values _setup_measurement filled in.
+            points (int): Only save the first points values of each result, e.g. those measured before a sweep was interrupted.
+                Defaults to None, which saves all of them.
+        """
+        for i, value in values.items():
+            results[i][1] = value
+        if points is not None:
+            for result in results:
+                result[1] = result[1][:points]
+        datasaver.add_result(*results)
+        datasaver.flush_data_to_database()
+
+    @staticmethod
+    def _progress_bar(total, desc, position=0, leave=True):
+        """A tqdm progress bar over the points of a sweep, throttled so the notebook is not sent a message for every point of a fast sweep.
+
+        Args:
+            total (int): The number of points.
+            desc (str): The description shown next to the bar.
+            position (int): The line to draw the bar on. Defaults to 0.
+            leave (bool): Whether to leave the bar on screen once it is done. Defaults to True.
+
+        Returns:
+            tqdm: The progress bar.
+        """
+        return tqdm(range(total), desc=desc, position=position, leave=leave, mininterval=0.5, miniters=max(1, total//50))
+
+    @staticmethod
+    def _with_progress(bar, values):
+        """Iterate over the voltages of a sweep like enumerate, updating the progress bar as the points are measured.
+
+        The bar is updated in blocks of points rather than on every point, and with the points left over from the last block at the end.
+
+        Args:
+            bar (tqdm): The progress bar, see _progress_bar.
+            values: The voltages of the sweep.
+
+        Yields:
+            tuple: The index of each voltage and the voltage.
+        """
+        bar_step = max(1, len(values)//100)
+        for index, value in enumerate(values):
+            yield index, value
+            if not (index + 1) % bar_step:
+                bar.update(bar_step)
+        bar.update(len(values) - bar.n)
+
     @exception_handler_general
-    def set_channel_voltage(self, channels, voltages):
+    def set_channel_voltage(self, channels, voltages, wait=True):
+        """Ramp one or more channels to the given voltages.
+
+        The QDAC can only ramp 8 channels at once, so longer lists of channels are ramped 8 at a time, one group after the other.
+
+        Args:
+            channels: A channel number or a list of channel numbers.
+            voltages: The voltage, or list of voltages, to ramp the channels to.
+            wait: If True, sleep until the ramp has finished. If False, return straight after the ramp
+                has been started, so the caller can do other work and then wait with `_sleep_until`.
+
+        Returns:
+            True if wait is True, otherwise the duration of the ramp (of the last group, when the channels are ramped in groups) in seconds.
+        """
+        return self._set_channel_voltage_raw(channels, voltages, wait)
+
+    def _set_channel_voltage_raw(self, channels, voltages, wait=True):
+        """set_channel_voltage without the exception handler, for the methods that already have one (e.g. the sweeps)."""
+        # Ramps start from the voltages in the driver's parameter caches, which it keeps up to date on every ramp,
+        # so the QDAC does not have to be queried first.
         if type(channels) == int:
-            current_voltages = self.get_channel_voltage(channels)
+            current_voltages = self._ch_v[channels].cache.get()
             max_voltage_difference = voltages - current_voltages
             duration = self.qdac.ramp_voltages([channels],[current_voltages],[voltages],self.waiting_time(max_voltage_difference))
-            time.sleep(duration) # Wait some time after setting the channel voltage.
         else:
-            # produce a list of the current voltages for each channel
-            current_voltages = self.get_channel_voltage(channels)
-            max_voltage_difference = np.max(np.subtract(voltages, current_voltages))
-            duration = self.qdac.ramp_voltages(channels,current_voltages,voltages,self.waiting_time(max_voltage_difference))
-            time.sleep(duration) # Wait some time after setting the channel voltage.
+            # Only the channels that are not already at their voltage are ramped, e.g. channels already at 0 V when ramping down.
+            cached = {channel: self._ch_v[channel].cache.get() for channel in channels}
+            moves = [(channel, cached[channel], voltage) for channel, voltage in zip(channels, voltages) if cached[channel] != voltage]
+            # More channels than there are function generators are ramped in groups, each one after the previous one has finished.
+            duration = 0.0
+            for start in range(0, len(moves), self._MAX_RAMP_CHANNELS):
+                time.sleep(duration)
+                ramp_channels, current_voltages, target_voltages = map(list, zip(*moves[start:start + self._MAX_RAMP_CHANNELS]))
+                # The ramp time is set by the channel that has to move the furthest, in either direction.
+                max_voltage_difference = max(abs(target - current) for current, target in zip(current_voltages, target_voltages))
+                duration = self.qdac.ramp_voltages(ramp_channels,current_voltages,target_voltages,self.waiting_time(max_voltage_difference))
+        if not wait:
+            return duration
+        time.sleep(duration) # Wait some time after setting the channel voltage.
         return True
 
+    def _ramp_to_zero(self):
+        """Ramp all the connected channels down to 0 V together, with as few multi-channel ramps as the QDAC allows."""
+        self._set_channel_voltage_raw(self.connected_channels, [0.0]*len(self.connected_channels))
+        print(f"The following channels have ramped down to 0.0V: {self.connected_channels}.")
+
     @exception_handler_general
     def get_channel_voltage(self, channels):
+        return self._get_channel_voltage_raw(channels)
+
+    def _get_channel_voltage_raw(self, channels):
+        """get_channel_voltage without the exception handler, for the methods that already have one (e.g. the sweeps)."""
         if type(channels) == int:
-            
-            channel_number_abrev = "self.qdac.ch{:02d}.v".format(channels)
-            channel_number_v_function = eval(channel_number_abrev)
-            channel_voltages = channel_number_v_function.get()
+            channel_voltages = self._ch_v[channels].get()
         else:
-            channel_voltages = []
-            for channel in channels:
-                channel_number_abrev = "self.qdac.ch{:02d}.v".format(channel)
-                channel_number_v_function = eval(channel_number_abrev)
-                channel_voltages.append(channel_number_v_function.get())
+            # One status query for all the channels rather than one query per channel.
+            all_voltages = self._get_all_voltages_raw()
+            channel_voltages = [all_voltages[channel] for channel in channels]
     
         return channel_voltages
 
+    @exception_handler_general
+    def get_all_voltages(self):
+        """Read the voltages of all the QDAC channels.
+
+        The QDAC reports the voltages of all channels in a single status query, which the driver stores in the
+        parameter caches, instead of querying the channels one at a time.
+
+        Returns:
+            dict: The voltage of each channel, keyed by channel number.
+        """
+        return self._get_all_voltages_raw()
+
+    def _get_all_voltages_raw(self):
+        """get_all_voltages without the exception handler, for the methods that already have one (e.g. the sweeps)."""
+        # The only call to a private method of the QDAC driver, kept here so it is easy to find if the driver changes.
+        # QDac._update_cache (as in qcodes 0.35) reads the status of all channels in one query and stores the voltages
+        # in the parameter caches. The public snapshot(update=True) would also get every other parameter of the QDAC.
+        self.qdac._update_cache(update_currents=False)
+        return {channel_number: v.cache.get() for channel_number, v in self._ch_v.items()}
+
     @exception_handler_general
     def get_current(self):
         # Need to see how we actually measure current first. Add VNA functionality too.
-        return self.dmm.volt.get()
+        return self._dmm_volt_get()
     
 
 
 
     @exception_handler_general   
     def dc_2d_gate_sweep(self, channel_number_1, channel_number_2, experiment_name="test", device_name ="test_device", database_file="test_measurements.db", max_voltage_ch1=1, min_voltage_ch1 = 0,max_voltage_ch2=1, min_voltage_ch2 = 0, 
-                    number_of_steps_ch1 = 100,number_of_steps_ch2 = 100):
+                    number_of_steps_ch1 = 100,number_of_steps_ch2 = 100, hardware_sweep=False, snake_scan=False):
         """Function to perform a measurement sweep of 2 gates on the device.
 
+        With snake_scan=True the 2nd channel is swept up on even rows and back down on odd rows, so it never has to
+        fly back to the start of its sweep between rows. It is off by default, since the rows are then not all measured in
+        the same direction, which changes the data of a device that shows hysteresis.
+
+        With hardware_sweep=True each row of the 2nd channel is stepped through by the QDAC's own staircase generator
+        in a single command, while the DMM takes one reading in the middle of each step on its own sample timer and
+        returns the whole row in one transfer. The steps are timed by the instruments rather than confirmed one at a
+        time, so this is meant for fast (coarse) tuning scans.
+
         Args:
             channel_number_1 (int): The channel number associated with the 1st channel.
             channel_number_2 (int): The channel number associated with the 2nd channel.
@@ -180,6 +562,8 @@ class Device:
             min_voltage_ch2 (float): The minimum voltage to sweep your 2nd channel from. Defaults to 0.
             number_of_steps_ch1 (int): The number of measurement steps to use during the voltage sweep for the 1st channel. Defaults to 100.
             number_of_steps_ch2 (int):  The number of measurement steps to use during the voltage sweep for the 2nd channel. Defaults to 100.
+            hardware_sweep (bool): Whether to let the instruments pace each row of the 2nd channel. Defaults to False.
+            snake_scan (bool): Whether to sweep the 2nd channel in alternating directions on successive rows. Defaults to False.
 
         Returns:
             str: The local path to the database file to which the measurement was saved.
@@ -187,103 +571,106 @@ class Device:
 
         assert (channel_number_1 in self.connected_channels) and (channel_number_2 in self.connected_channels), "The channel numbers you wish to sweep should be found in the connected_channels argument you pass in the creation of your Device object"
 
-        int_time = self.dmm.get("NPLC") / 50 # The integration time -> time taken to perform a measurement.
-
-        initialise_or_create_database_at(f"./measurement_results/{database_file}")
-
-        # You can only have 1 db at a time
-        test_exp = load_or_create_experiment(
-        experiment_name=experiment_name,
-        sample_name=device_name)
-
-   
-
-
-        voltages_ch1 = np.linspace(min_voltage_ch1, max_voltage_ch1, number_of_steps_ch1) # create a numpy array with all the voltages to be set on each channel
-        voltages_ch2 = np.linspace(min_voltage_ch2, max_voltage_ch2, number_of_steps_ch2)
+        # all the voltages to be set on each channel,
+        # together with the ramp time of a single step, which is the same for every step after the first one.
+        voltages_ch1, wait1 = self._sweep_steps(min_voltage_ch1, max_voltage_ch1, number_of_steps_ch1)
+        voltages_ch2, wait2 = self._sweep_steps(min_voltage_ch2, max_voltage_ch2, number_of_steps_ch2)
+        # The voltages for the odd rows: reversed when snake scanning, otherwise the same as the even rows.
+        voltages_ch2_odd = voltages_ch2[::-1] if snake_scan else voltages_ch2
         
+        ramp = self._set_channel_voltage_fast
+        ch2_list = [channel_number_2]
+        ch1_ch2_list = [channel_number_1, channel_number_2]
 
-        # Perform concatination and use eval to store the .v methods for the channel numbers passed as arugments
-        ch1_sweep_abrev = "self.qdac.ch{:02d}.v".format(channel_number_1)
-        ch1_number_v_sweep_function = eval(ch1_sweep_abrev)
-        ch2_sweep_abrev = "self.qdac.ch{:02d}.v".format(channel_number_2)
-        ch2_number_v_sweep_function = eval(ch2_sweep_abrev)
-        
-        # produce a station object to store the instruments to be used during the experiment
-        station = qc.Station()
-
-        station.add_component(self.qdac)
-        station.add_component(self.dmm)
-
-        # The Measurement object is used to obtain data from instruments in QCoDeS, 
-        # It is instantiated with both an experiment (to handle data) and station to control the instruments.
-        context_meas = Measurement(exp=test_exp, station=station, name='1d_sweep') # create a new meaurement object using the station defined above.
-
-
-        channel_set_points = []
-        results = [None] * (len(self.connected_channels)+1)
-
-        # Register the independent parameters...
-        for i, channel in enumerate(self.connected_channels):
-            # Perform concatination and use eval to store the .v methods for the channel numbers passed as arugments
-            channel_number_abrev = "self.qdac.ch{:02d}.v".format(channel)
-            channel_number_v_function = eval(channel_number_abrev)
-            channel_set_points.append(channel_number_v_function)
-            context_meas.register_parameter(channel_number_v_function)
-            if (channel != channel_number_1) and (channel != channel_number_2):
-                results[i] = (channel_number_v_function, self.get_channel_voltage(channel)) # Needs to be inside parenthesis to be a tuple.
-
-
-        # ...then register the dependent parameters
-        context_meas.register_parameter(self.dmm.volt, setpoints=(channel_set_points[:]))
+        int_time = self.dmm.get("NPLC") / 50 # The integration time -> time taken to perform a measurement.
 
-        # Time for periodic background database writes
-        context_meas.write_period = 2
+        # Each row is flushed as it is saved, so the periodic database writes are only a fallback
+        # and happen at most about once per row.
+        row_time = number_of_steps_ch2 * (int_time + wait2)
+        context_meas, results = self._setup_measurement(database_file, experiment_name, device_name, '1d_sweep',
+                                                        swept_channels=[channel_number_1, channel_number_2], row_length=number_of_steps_ch2,
+                                                        write_period=max(2.0, row_time))
 
         # Define the tqdm progress bars:
-        outter_bar = tqdm(range(number_of_steps_ch1), desc = f"Channel {channel_number_1} progress:",  position=0, leave=True)
-        inner_bar = tqdm(range(number_of_steps_ch2), desc = f"Channel {channel_number_2} progress:",  position=1, leave=True)
+        outter_bar = self._progress_bar(number_of_steps_ch1, f"Channel {channel_number_1} progress:")
+        inner_bar = self._progress_bar(number_of_steps_ch2, f"Channel {channel_number_2} progress:", position=1, leave=False)
 
         ch1_index = self.connected_channels.index(channel_number_1)
         ch2_index = self.connected_channels.index(channel_number_2)
 
-        with context_meas.run() as datasaver: # initialise measurement run 
-
-            for set_v_ch1 in voltages_ch1: # for each voltage that we want to set on the qdac for channel '1'
-                # Ramp the voltage up slowly using the waiting time function to ensure that the specified slope (default = 1) is not exceeded.
-                self.set_channel_voltage(channels = channel_number_1, voltages = set_v_ch1)
-                outter_bar.update(1) # update outer progress bar
-                inner_bar.reset()
-                results[ch1_index] = (ch1_number_v_sweep_function, set_v_ch1)
-
-
-                for set_v_ch2 in voltages_ch2: # for each voltage that we want to set on the qdac for channel '1'
-                    self.set_channel_voltage(channels = [1,2,3,4,5], voltages = 5* [set_v_ch2])
-             
-
-
-                    inner_bar.update(1) # update outer progress bar
-                    results[ch2_index] = (ch2_number_v_sweep_function, set_v_ch2)
-
-
-                    time.sleep(3*int_time) # wait some time including the additional integration time of our DMM.
+        prev_v1 = self._ch_v[channel_number_1].cache.get()
+        prev_v2 = self._ch_v[channel_number_2].cache.get()
+
+        # The results of the whole sweep are preallocated as one array per parameter, with one row per step of the 1st channel.
+        # A row is saved to the db in one call and handed to the datasaver as a view, since it is not written to again.
+        grid_v1 = np.repeat(np.asarray(voltages_ch1), number_of_steps_ch2).reshape(number_of_steps_ch1, number_of_steps_ch2)
+        rows_v2 = (np.asarray(voltages_ch2), np.asarray(voltages_ch2_odd)) # the even and odd rows of the 2nd channel
+        readings = np.empty((number_of_steps_ch1, number_of_steps_ch2))
+
+        if hardware_sweep:
+            # Each step of a row lasts the time the DMM needs for a reading, but never less than the slope allows.
+            # The QDAC rounds its step length down to whole ms, so it is rounded up here instead and the same value
+            # is given to the DMM, otherwise the readings would drift out of step with the staircase along the row.
+            dwell = math.ceil(max(3*int_time, wait2)*1000)/1000
+            # The first reading is taken half way through the first step, and every following one a step later.
+            bus_trigger = self._dmm_bus_triggered(samples=number_of_steps_ch2, interval=dwell, delay=dwell/2)
+        else:
+            bus_trigger = self._dmm_bus_triggered()
 
-                    get_v = self.dmm.volt.get()
+        with bus_trigger, context_meas.run() as datasaver: # initialise measurement run 
 
+            def save_row(index):
+                # Save a whole row of measurement results into the db.
+                self._save_results(datasaver, results, {ch1_index: grid_v1[index], ch2_index: rows_v2[index % 2], -1: readings[index]})
 
-                    # change this function to use channel number list
-                    # # make a tuple of tuples not including 
-                    results[-1] = (self.dmm.volt, get_v)
+            for index_1, set_v_ch1 in enumerate(voltages_ch1): # for each voltage that we want to set on the qdac for channel '1'
+                row_v_ch2 = voltages_ch2_odd if index_1 % 2 else voltages_ch2
 
-                    # Save the measurement results into the db.
-                    datasaver.add_result(*results)
+                # Ramp the voltage up slowly using the waiting time function to ensure that the specified slope (default = 1) is not exceeded.
+                # Channel 2 is ramped to the start of its row in the same call, so both channels slew in parallel
+                # and we only have to wait for the slower of the two. When snake scanning it is already there after the first row.
+                ramptime_1 = wait1 if index_1 else self.waiting_time(set_v_ch1 - prev_v1)
+                ramptime_1 = max(ramptime_1, self.waiting_time(row_v_ch2[0] - prev_v2))
+                duration_1 = ramp(ch1_ch2_list, [prev_v1, prev_v2], [set_v_ch1, row_v_ch2[0]], ramptime_1)
+                ramp_end = time.monotonic() + duration_1
+                # The previous row is saved while the channels ramp, instead of after it has been measured.
+                if index_1:
+                    save_row(index_1 - 1)
+                _sleep_until(ramp_end)
+                prev_v1 = set_v_ch1
+                prev_v2 = row_v_ch2[0]
+                outter_bar.update(1) # update outer progress bar
+                inner_bar.reset()
+                buf_r = readings[index_1]
+
+                if hardware_sweep:
+                    # Step through the whole row with one staircase command (there is no slow channel, the outer
+                    # loop is still stepped from Python) and start the DMM's timed readings at the same moment,
+                    # so reading k is taken while channel 2 sits at row_v_ch2[k].
+                    buf_r[:] = self._read_after_ramp(self.qdac.ramp_voltages_2d, timed=True,
+                                                     slow_chans=[], slow_vstart=[], slow_vend=[],
+                                                     fast_chans=ch2_list, fast_vstart=[row_v_ch2[0]], fast_vend=[row_v_ch2[-1]],
+                                                     step_length=dwell, slow_steps=1, fast_steps=number_of_steps_ch2)
+                    prev_v2 = row_v_ch2[-1]
+                    inner_bar.update(number_of_steps_ch2)
+                else:
+                    for index_2, set_v_ch2 in self._with_progress(inner_bar, row_v_ch2): # for each voltage that we want to set on the qdac for channel '2'
+                        # Channel 2 has already been ramped to the start of the row together with channel 1,
+                        # so there is nothing to ramp or wait for on the first step.
+                        if index_2:
+                            buf_r[index_2] = self._read_after_ramp(ramp, ch2_list, [prev_v2], [set_v_ch2], wait2)[0]
+                        else:
+                            buf_r[index_2] = self._read_after_ramp(None)[0]
+                        prev_v2 = set_v_ch2
+
+            # The last row has no ramp after it to hide behind.
+            save_row(number_of_steps_ch1 - 1)
                 
             
         print("Measurement complete.")
 
         # Ramp down the voltages to zero so a voltage is not left on the device.
-        self.set_channel_voltage(self.connected_channels, [0.0]*len(self.connected_channels))
-        print(f"The following channels have ramped down to 0.0V: {self.connected_channels}.")
+        self._ramp_to_zero()
 
 
         # # Convenient to have for plotting and data access
@@ -314,102 +701,79 @@ class Device:
 
         assert (channel_number_sd in self.connected_channels), "The channel numbers you wish to sweep should be found in the connected_channels argument you pass in the creation of your Device object"
 
-        int_time = self.dmm.get("NPLC") / 50 # The integration time -> time taken to perform a measurement.
-
-        initialise_or_create_database_at(f"./measurement_results/{database_file}")
-
-        # You can only have 1 db at a time
-        test_exp = load_or_create_experiment(
-        experiment_name=experiment_name,
-        sample_name=device_name)
-
         gate_list = self.connected_channels[:]
         gate_list.remove(channel_number_sd)
+        assert len(gate_list) <= self._MAX_RAMP_CHANNELS, f"The gates are ramped together on every step, and the QDAC can only ramp {self._MAX_RAMP_CHANNELS} channels at once, so at most {self._MAX_RAMP_CHANNELS + 1} channels can be connected for this sweep."
 
-        voltages_sd = np.linspace(min_voltage_sd, max_voltage_sd, number_of_steps_sd) # create a numpy array with all the voltages to be set on each channel
-        voltages_gates = np.linspace(min_voltage_all_gates, max_voltage_all_gates, number_of_steps_all_gates)
-        
-
-        # Perform concatination and use eval to store the .v methods for the channel numbers passed as arugments
-        ch_sweep_abrev_sd = "self.qdac.ch{:02d}.v".format(channel_number_sd)
-        ch_number_v_sweep_function_sd = eval(ch_sweep_abrev_sd)
+        voltages_sd = self._sweep_voltages(min_voltage_sd, max_voltage_sd, number_of_steps_sd) # all the voltages to be set on each channel
+        voltages_gates, wait_gates = self._sweep_steps(min_voltage_all_gates, max_voltage_all_gates, number_of_steps_all_gates)
+        int_time = self.dmm.get("NPLC") / 50 # The integration time -> time taken to perform a measurement.
         
-        # produce a station object to store the instruments to be used during the experiment
-        station = qc.Station()
-
-        station.add_component(self.qdac)
-        station.add_component(self.dmm)
-
-        # The Measurement object is used to obtain data from instruments in QCoDeS, 
-        # It is instantiated with both an experiment (to handle data) and station to control the instruments.
-        context_meas = Measurement(exp=test_exp, station=station, name='2d_sweep') # create a new meaurement object using the station defined above.
-
+        # Each row is flushed as it is saved, so the periodic database writes are only a fallback
+        # and happen at most about once per row.
+        row_time = number_of_steps_all_gates * (int_time + wait_gates)
+        context_meas, results = self._setup_measurement(database_file, experiment_name, device_name, '2d_sweep',
+                                                        swept_channels=self.connected_channels, row_length=number_of_steps_all_gates,
+                                                        write_period=max(2.0, row_time))
 
-        channel_set_points = []
-        results = [None] * (len(self.connected_channels)+1)
+        # Define the tqdm progress bars:
+        outter_bar = self._progress_bar(number_of_steps_sd, f"Channel {channel_number_sd} progress:")
+        inner_bar = self._progress_bar(number_of_steps_all_gates, "Gate sweep progress:", position=1, leave=False)
 
-        # Register the independent parameters...
-        for i, channel in enumerate(self.connected_channels):
-            # Perform concatination and use eval to store the .v methods for the channel numbers passed as arugments
-            channel_number_abrev = "self.qdac.ch{:02d}.v".format(channel)
-            channel_number_v_function = eval(channel_number_abrev)
-            channel_set_points.append(channel_number_v_function)
-            context_meas.register_parameter(channel_number_v_function)
+        ch_sd_index = self.connected_channels.index(channel_number_sd)
+        gate_indices = [self.connected_channels.index(channel) for channel in gate_list]
 
+        # The results of the whole sweep are preallocated as one array per parameter, with one row per source-drain step.
+        # A row is saved to the db in one call and handed to the datasaver as a view, since it is not written to again.
+        grid_sd = np.repeat(np.asarray(voltages_sd), number_of_steps_all_gates).reshape(number_of_steps_sd, number_of_steps_all_gates)
+        row_gates = np.asarray(voltages_gates) # the same for every row
+        readings = np.empty((number_of_steps_sd, number_of_steps_all_gates))
 
-        # ...then register the dependent parameters
-        context_meas.register_parameter(self.dmm.volt, setpoints=(channel_set_points[:]))
+        # All the gates are set to the same voltages, so they share one array.
+        for i in gate_indices:
+            results[i][1] = row_gates
 
-        # Time for periodic background database writes
-        context_meas.write_period = 2
+        ramp = self._set_channel_voltage_fast
+        number_of_gates = len(gate_list)
+        prev_v_gates = None # the voltage of the gates, set by the first step of each row, which ramps from their cached voltages
 
-        # Define the tqdm progress bars:
-        outter_bar = tqdm(range(number_of_steps_sd), desc = f"Channel {channel_number_sd} progress:",  position=0, leave=True)
-        inner_bar = tqdm(range(number_of_steps_all_gates), desc = "Gate sweep progress:",  position=1, leave=True)
+        bus_trigger = self._dmm_bus_triggered()
 
-        ch_sd_index = self.connected_channels.index(channel_number_sd)
-
- 
-      
+        with bus_trigger, context_meas.run() as datasaver: # initialise measurement run 
 
-        with context_meas.run() as datasaver: # initialise measurement run 
+            def save_row(index):
+                # Save a whole row of measurement results into the db.
+                self._save_results(datasaver, results, {ch_sd_index: grid_sd[index], -1: readings[index]})
 
-            for set_v_ch1 in voltages_sd: # for each voltage that we want to set on the qdac for channel '1'
+            for index_1, set_v_ch1 in enumerate(voltages_sd): # for each voltage that we want to set on the qdac for channel '1'
                 # Ramp the voltage up slowly using the waiting time function to ensure that the specified slope (default = 1) is not exceeded.
-                self.set_channel_voltage(channels = channel_number_sd, voltages = set_v_ch1)
+                duration_1 = self._set_channel_voltage_raw(channels = channel_number_sd, voltages = set_v_ch1, wait = False)
+                ramp_end = time.monotonic() + duration_1
+                # The previous row is saved while the channel ramps, instead of after it has been measured.
+                if index_1:
+                    save_row(index_1 - 1)
+                _sleep_until(ramp_end)
                 outter_bar.update(1) # update outer progress bar
                 inner_bar.reset()
-                results[ch_sd_index] = (ch_number_v_sweep_function_sd, set_v_ch1)
-
-                for set_v_ch2 in voltages_gates: # for each voltage that we want to set on the qdac for channel '1'
-                    self.set_channel_voltage(channels = gate_list, voltages = len(gate_list) * [set_v_ch2])
-             
-           
-                    inner_bar.update(1) # update outer progress bar
-
-
-                    time.sleep(3*int_time) # wait some time including the additional integration time of our DMM.
-
-                    get_v = self.dmm.volt.get()
-
-         
-                    for i, channel in enumerate(self.connected_channels):
-                        channel_number_abrev = "self.qdac.ch{:02d}.v".format(channel)
-                        channel_number_v_function = eval(channel_number_abrev)
-                        if channel != channel_number_sd:
-                            results[i] = (channel_number_v_function, set_v_ch2) # Needs to be inside parenthesis to be a tuple.
-
-                    results[-1] = (self.dmm.volt, get_v)
-
-                    # Save the measurement results into the db.
-                    datasaver.add_result(*results)
+                buf_r = readings[index_1]
+
+                for index_2, set_v_ch2 in self._with_progress(inner_bar, voltages_gates): # for each voltage that we want to set on the gate channels
+                    # All the gates move by the same step, so after the first one the ramp time is already known.
+                    # The first step starts from wherever the gates are, so its ramp time is worked out from their voltages.
+                    if index_2:
+                        buf_r[index_2] = self._read_after_ramp(ramp, gate_list, [prev_v_gates] * number_of_gates, [set_v_ch2] * number_of_gates, wait_gates)[0]
+                    else:
+                        buf_r[index_2] = self._read_after_ramp(self._set_channel_voltage_raw, gate_list, [set_v_ch2] * number_of_gates, wait=False)[0]
+                    prev_v_gates = set_v_ch2
+
+            # The last row has no ramp after it to hide behind.
+            save_row(number_of_steps_sd - 1)
                 
             
         print("Measurement complete.")
 
         # Ramp down the voltages to zero so a voltage is not left on the device.
-        self.set_channel_voltage(self.connected_channels, [0.0]*len(self.connected_channels))
-        print(f"The following channels have ramped down to 0.0V: {self.connected_channels}.")
+        self._ramp_to_zero()
 
           
         return  qc.config.core.db_location # the location of the db file.
@@ -417,9 +781,12 @@ class Device:
 
     @exception_handler_general   
     def dc_1d_gate_sweep(self, sweep_channel, experiment_name="test", device_name ="test_device", database_file="test_measurements.db", max_voltage=1, min_voltage = 0, 
-        number_of_steps = 100):
+        number_of_steps = 100, hardware_sweep=False):
         """Function to perform a measurement sweep of 1 of the gates on the device, whilst keeping the others fixed.
 
+        With hardware_sweep=True the sweep is stepped through by the QDAC's own staircase generator in a single command,
+        while the DMM takes one reading in the middle of each step into its memory and returns them all in one transfer.
+
         Args:
             sweep_channel (int): The channel number associated with the sweep channel.
             experiment_name (str): The name of the experiment which tp associate this measurment with. Defaults to "test".
@@ -428,6 +795,7 @@ class Device:
             max_voltage (float): The maximum voltage to sweep your 2nd channel to. Defaults to 1.
             min_voltage (float): The minimum voltage to sweep your 2nd channel from. Defaults to 0.
             number_of_steps (int):  The number of measurement steps to use during the voltage sweep for the 2nd channel. Defaults to 100.
+            hardware_sweep (bool): Whether to let the instruments pace the sweep. Defaults to False.
 
         Returns:
             str: The local path to the database file to which the measurement was saved.
@@ -435,81 +803,67 @@ class Device:
         assert (sweep_channel in self.connected_channels), "The channel number you wish to sweep should be found in the connected_channels argument you pass in the creation of your Device object."
 
 
-        int_time = self.dmm.get("NPLC") / 50 # The integration time -> time taken to perform a measurement.
-
-        initialise_or_create_database_at(f"./measurement_results/{database_file}")
-
-        # You can only have 1 db at a time
-        test_exp = load_or_create_experiment(
-        experiment_name=experiment_name,
-        sample_name=device_name)
-
-        # Perform concatination and use eval to store the .v methods for the channel numbers passed as arugments
-        channel_number_sweep_abrev = "self.qdac.ch{:02d}.v".format(sweep_channel)
-        channel_number_v_sweep_function = eval(channel_number_sweep_abrev)
-
-        # create a numpy array with all the voltages to be set on channel 2
-        voltages_sweep = np.linspace(min_voltage, max_voltage, number_of_steps)
-        
-        # produce a station object to store the instruments to be used during the experiment
-        station = qc.Station()
-
-        station.add_component(self.qdac)
-        station.add_component(self.dmm)
-
-        # The Measurement object is used to obtain data from instruments in QCoDeS, 
-        # It is instantiated with both an experiment (to handle data) and station to control the instruments.
-        context_meas = Measurement(exp=test_exp, station=station, name='1d_sweep') # create a new meaurement object using the station defined above.
-
-
-        channel_set_points = []
-        results = [None] * (len(self.connected_channels)+1)
-
-        # Register the independent parameters...
-        for i, channel in enumerate(self.connected_channels):
-            # Perform concatination and use eval to store the .v methods for the channel numbers passed as arugments
-            channel_number_abrev = "self.qdac.ch{:02d}.v".format(channel)
-            channel_number_v_function = eval(channel_number_abrev)
-            channel_set_points.append(channel_number_v_function)
-            context_meas.register_parameter(channel_number_v_function)
-            if (channel != sweep_channel):
-                results[i] = (channel_number_v_function, self.get_channel_voltage(channel)) # Needs to be inside parenthesis to be a tuple.
-
+        ramp = self._set_channel_voltage_fast
+        sweep_list = [sweep_channel]
 
-        # ...then register the dependent parameters
-        context_meas.register_parameter(self.dmm.volt, setpoints=(channel_set_points[:]))
+        # all the voltages to be set on the sweep channel,
+        # together with the ramp time of a single step, which is the same for every step after the first one.
+        voltages_sweep, wait = self._sweep_steps(min_voltage, max_voltage, number_of_steps)
 
-        # Time for periodic background database writes
-        context_meas.write_period = 2
+        context_meas, results = self._setup_measurement(database_file, experiment_name, device_name, '1d_sweep',
+                                                        swept_channels=[sweep_channel], row_length=number_of_steps, write_period=2)
 
         # Define the tqdm progress bars:
-        outter_bar = tqdm(range(number_of_steps), desc = f"Channel {sweep_channel} progress:",  position=0, leave=True)
+        outter_bar = self._progress_bar(number_of_steps, f"Channel {sweep_channel} progress:")
         sweep_index = self.connected_channels.index(sweep_channel)
-        with context_meas.run() as datasaver: # initialise measurement run 
-
-            for set_v in voltages_sweep: # for each voltage that we want to set on the qdac for channel '1'
-                # Ramp the voltage up slowly using the waiting time function to ensure that the specified slope (default = 1) is not exceeded.
-                self.set_channel_voltage(channels = sweep_channel, voltages = set_v)
-                outter_bar.update(1) # update outer progress bar
-
-                time.sleep(3*int_time) # wait some time including the additional integration time of our DMM.
-
-                get_v = self.dmm.volt.get()
-
-                # change this function to use channel number list
-                # # make a tuple of tuples not including 
-                results[sweep_index] = (channel_number_v_sweep_function, set_v)
-                results[-1] = (self.dmm.volt, get_v)
 
-                # Save the measurement results into the db.
-                datasaver.add_result(*results)
+        # Preallocate the buffers holding the results of the sweep, so that they are written to the db in one call.
+        buf_v = np.asarray(voltages_sweep)
+        buf_r = np.empty(number_of_steps)
+        sweep_results = {sweep_index: buf_v, -1: buf_r}
+        measured = 0 # the number of points measured so far
+
+        prev_v = self._ch_v[sweep_channel].cache.get()
+
+        if hardware_sweep:
+            # Each step lasts the time the DMM needs for a reading, but never less than the slope allows.
+            int_time = self.dmm.get("NPLC") / 50 # The integration time -> time taken to perform a measurement.
+            # Rounded up to whole ms, like the steps of the 2D hardware sweep, so the DMM's timer matches the QDAC's steps.
+            dwell = math.ceil(max(3*int_time, wait)*1000)/1000
+            # All the readings of the sweep are stored in the DMM's memory, the first one half way through the first step.
+            bus_trigger = self._dmm_bus_triggered(samples=number_of_steps, interval=dwell, delay=dwell/2)
+        else:
+            bus_trigger = self._dmm_bus_triggered()
+
+        with bus_trigger, context_meas.run() as datasaver: # initialise measurement run 
+            try:
+                if hardware_sweep:
+                    # Ramp to the start of the sweep, then step through the whole sweep with one staircase command
+                    # and start the DMM's timed readings at the same moment, so reading k is taken while the channel sits at voltages_sweep[k].
+                    time.sleep(ramp(sweep_list, [prev_v], [voltages_sweep[0]], self.waiting_time(voltages_sweep[0] - prev_v)))
+                    buf_r[:] = self._read_after_ramp(self.qdac.ramp_voltages_2d, timed=True,
+                                                     slow_chans=[], slow_vstart=[], slow_vend=[],
+                                                     fast_chans=sweep_list, fast_vstart=[voltages_sweep[0]], fast_vend=[voltages_sweep[-1]],
+                                                     step_length=dwell, slow_steps=1, fast_steps=number_of_steps)
+                    measured = number_of_steps
+                    outter_bar.update(number_of_steps)
+                else:
+                    for index, set_v in self._with_progress(outter_bar, voltages_sweep): # for each voltage that we want to set on the qdac for channel '1'
+                        # Ramp the voltage up slowly using the waiting time function to ensure that the specified slope (default = 1) is not exceeded.
+                        ramptime = wait if index else self.waiting_time(set_v - prev_v)
+                        buf_r[index] = self._read_after_ramp(ramp, sweep_list, [prev_v], [set_v], ramptime)[0]
+                        prev_v = set_v
+                        measured = index + 1
+            finally:
+                # Save the measurement results into the db. If the sweep is interrupted, the points measured so far are saved.
+                if measured:
+                    self._save_results(datasaver, results, sweep_results, points=measured)
                 
             
         print("Measurement complete.")
 
         # Ramp down the voltages to zero so a voltage is not left on the device.
-        self.set_channel_voltage(self.connected_channels, [0.0]*len(self.connected_channels))
-        print(f"The following channels have ramped down to 0.0V: {self.connected_channels}.")
+        self._ramp_to_zero()
 
 
 
@@ -536,87 +890,57 @@ class Device:
             str: The local path to the database file to which the measurement was saved.
         """
 
-
-        int_time = self.dmm.get("NPLC") / 50 # The integration time -> time taken to perform a measurement.
-
-        initialise_or_create_database_at(f"./measurement_results/{database_file}")
-
-        # You can only have 1 db at a time
-        test_exp = load_or_create_experiment(
-        experiment_name=experiment_name,
-        sample_name=device_name)
-
+        assert len(sweep_channels) <= self._MAX_RAMP_CHANNELS, f"The sweep channels are ramped together on every step, and the QDAC can only ramp {self._MAX_RAMP_CHANNELS} channels at once."
 
 
-        # create a numpy array with all the voltages to be set on channel 2
-        voltages_sweep = np.linspace(min_voltage, max_voltage, number_of_steps)
-        
-        # produce a station object to store the instruments to be used during the experiment
-        station = qc.Station()
-
-        station.add_component(self.qdac)
-        station.add_component(self.dmm)
-
-        # The Measurement object is used to obtain data from instruments in QCoDeS, 
-        # It is instantiated with both an experiment (to handle data) and station to control the instruments.
-        context_meas = Measurement(exp=test_exp, station=station, name='1d_sweep') # create a new meaurement object using the station defined above.
-
-
-        channel_set_points = []
-        results = [None] * (len(self.connected_channels)+1)
-
-        # Register the independent parameters...
-        for i, channel in enumerate(self.connected_channels):
-            # Perform concatination and use eval to store the .v methods for the channel numbers passed as arugments
-            channel_number_abrev = "self.qdac.ch{:02d}.v".format(channel)
-            channel_number_v_function = eval(channel_number_abrev)
-            channel_set_points.append(channel_number_v_function)
-            context_meas.register_parameter(channel_number_v_function)
-            if (channel not in sweep_channels):
-                results[i] = (channel_number_v_function, self.get_channel_voltage(channel)) # Needs to be inside parenthesis to be a tuple.
-
+        # all the voltages to be set on the sweep channels,
+        # together with the ramp time of a single step, which is the same for every step after the first one.
+        voltages_sweep, wait = self._sweep_steps(min_voltage, max_voltage, number_of_steps)
 
-        # ...then register the dependent parameters
-        context_meas.register_parameter(self.dmm.volt, setpoints=(channel_set_points[:]))
-
-        # Time for periodic background database writes
-        context_meas.write_period = 2
+        context_meas, results = self._setup_measurement(database_file, experiment_name, device_name, '1d_sweep',
+                                                        swept_channels=sweep_channels, row_length=number_of_steps, write_period=2)
 
         # Define the tqdm progress bars:
-        outter_bar = tqdm(range(number_of_steps), desc = f"Multi-gate sweep progress:",  position=0, leave=True)
-        with context_meas.run() as datasaver: # initialise measurement run 
-
-            for set_v in voltages_sweep: # for each voltage that we want to set on the qdac for channel '1'
-                # Ramp the voltage up slowly using the waiting time function to ensure that the specified slope (default = 1) is not exceeded.
-    
-
-                
-                self.set_channel_voltage(sweep_channels, [set_v] * len(sweep_channels))
-                outter_bar.update(1) # update outer progress bar
-
-                time.sleep(3*int_time) # wait some time including the additional integration time of our DMM.
-
-                get_v = self.dmm.volt.get()
-
-                # change this function to use channel number list
-                # # make a tuple of tuples not including 
-                for channel in sweep_channels:
-                    channel_number_abrev = "self.qdac.ch{:02d}.v".format(channel)
-                    channel_number_v_function = eval(channel_number_abrev)
-                    sweep_index = self.connected_channels.index(channel)
-                    results[sweep_index] = (channel_number_v_function, set_v)
-                        
-                results[-1] = (self.dmm.volt, get_v)
-
-                # Save the measurement results into the db.
-                datasaver.add_result(*results)
+        outter_bar = self._progress_bar(number_of_steps, "Multi-gate sweep progress:")
+        sweep_indices = [self.connected_channels.index(channel) for channel in sweep_channels]
+
+        # Preallocate the buffers holding the results of the sweep, so that they are written to the db in one call.
+        buf_v = np.asarray(voltages_sweep)
+        buf_r = np.empty(number_of_steps)
+        # All the sweep channels are set to the same voltages, so they share one array.
+        sweep_results = dict.fromkeys(sweep_indices, buf_v)
+        sweep_results[-1] = buf_r
+        measured = 0 # the number of points measured so far
+
+        ramp = self._set_channel_voltage_fast
+        number_of_sweep_channels = len(sweep_channels)
+        prev_v = None # the voltage of the sweep channels, set by the first step, which ramps from their cached voltages
+
+        bus_trigger = self._dmm_bus_triggered()
+
+        with bus_trigger, context_meas.run() as datasaver: # initialise measurement run 
+
+            try:
+                for index, set_v in self._with_progress(outter_bar, voltages_sweep): # for each voltage that we want to set on the qdac for the sweep channels
+                    # Ramp the voltage up slowly using the waiting time function to ensure that the specified slope (default = 1) is not exceeded.
+                    # All the sweep channels move by the same step, so after the first one the ramp time is already known.
+                    # The first step starts from wherever the channels are, so its ramp time is worked out from their voltages.
+                    if index:
+                        buf_r[index] = self._read_after_ramp(ramp, sweep_channels, [prev_v] * number_of_sweep_channels, [set_v] * number_of_sweep_channels, wait)[0]
+                    else:
+                        buf_r[index] = self._read_after_ramp(self._set_channel_voltage_raw, sweep_channels, [set_v] * number_of_sweep_channels, wait=False)[0]
+                    prev_v = set_v
+                    measured = index + 1
+            finally:
+                # Save the measurement results into the db. If the sweep is interrupted, the points measured so far are saved.
+                if measured:
+                    self._save_results(datasaver, results, sweep_results, points=measured)
                 
             
         print("Measurement complete.")
 
         # Ramp down the voltages to zero so a voltage is not left on the device.
-        self.set_channel_voltage(self.connected_channels, [0.0]*len(self.connected_channels))
-        print(f"The following channels have ramped down to 0.0V: {self.connected_channels}.")
+        self._ramp_to_zero()
 
 
 
@@ -642,18 +966,26 @@ class Device:
             labels = self.connected_channels #all gates
             
         assert len(params) == len(labels) #params needs to be the same length as labels
-        for i in range(len(params)):
-            self.set_channel_voltage(labels[i],params[i]) #function that takes dac key and value and sets dac to that value
+        # Ramp the channels together, so the jump takes as long as the largest step rather than the sum of them.
+        self.set_channel_voltage(list(labels), [float(v) for v in params])
         return params
 
     def check(self, inv=True):
-        
+        """Read the voltages of the channels from the QDAC.
+
+        Args:
+            inv (bool): Should the investigation gates (typically plunger gates) be read. Defaults to True.
+
+        Returns:
+            list: The voltages of the channels.
+        """
         if inv:
             labels = self.investigation_channels #plunger gates
         else:
             labels =self.connected_channels #all gates
-        # dac_state = [None]*len(labels)
-        dac_state = self.get_channel_voltage(labels) #function that takes dac key and returns state that channel is in
+
+        all_voltages = self.get_all_voltages()
+        dac_state = [all_voltages[channel] for channel in labels]
         return dac_state
 
     def measure(self):
@@ -676,7 +1008,8 @@ class Device:
             # Ramp down the voltages to zero so a voltage is not left on the device.
             # self.set_channel_voltage(self.connected_channels, [0.0]*len(self.connected_channels))
             # print(f"The following channels have ramped down to 0.0V: {self.connected_channels}.")
-            self.qdac.close()
+            self.dmm.close()
+            self.dmm_open = False
         print("Any connection to the DAC and DMM has been closed.")
 
 